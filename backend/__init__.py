@@ -1,11 +1,13 @@
 # backend/__init__.py
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from passlib.context import CryptContext
 from celery import Celery
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from redis import asyncio as aioredis
 from contextlib import asynccontextmanager
+import httpx
 
 from .config import settings
 from .database import ensure_indexes, seed_database_if_empty
@@ -17,7 +19,8 @@ async def lifespan(app: FastAPI):
     Handles startup and shutdown events.
     - Initializes Redis cache on startup.
     - Seeds the database on startup.
-    - Closes Redis connection on shutdown.
+    - Opens a shared HTTP client for outbound API calls.
+    - Closes Redis connection and HTTP client on shutdown.
     """
     # Startup
     redis = aioredis.from_url(settings.REDIS_URI, encoding="utf8", decode_responses=False)
@@ -25,16 +28,30 @@ async def lifespan(app: FastAPI):
     print("FastAPI-Cache initialized.")
     ensure_indexes()
     seed_database_if_empty()
+    app.state.http = httpx.AsyncClient(
+        timeout=10.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    )
     yield
     # Shutdown
+    await app.state.http.aclose()
     await redis.close()
     print("Redis connection closed.")
 
 # --- App Initialization ---
-app = FastAPI(title="Shopping Cart API", lifespan=lifespan)
+app = FastAPI(title="Shopping Cart API", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # --- Security ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# New hashes use argon2id; existing bcrypt hashes still verify and are
+# re-hashed with argon2 on the user's next successful login.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    default="argon2",
+    deprecated="auto",
+    argon2__memory_cost=19456,
+    argon2__time_cost=2,
+    argon2__parallelism=1,
+)
 
 # --- Celery ---
 celery_app = Celery(
@@ -42,7 +59,14 @@ celery_app = Celery(
     broker=settings.REDIS_URI,
     backend=settings.REDIS_URI
 )
-celery_app.conf.update(task_track_started=True)
+celery_app.conf.update(
+    task_track_started=True,
+    # Ack after the task finishes and fetch one task at a time, so long-running
+    # orders don't hold back tasks prefetched behind them (the `-Ofair` behaviour).
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    broker_transport_options={"visibility_timeout": 3600},
+)
 
 # --- API Routers ---
 from .products.routes import router as products_router
@@ -50,9 +74,11 @@ from .users.routes import router as users_router
 from .orders.routes import router as orders_router
 from .me.routes import router as me_router
 from .map.routes import router as map_router
+from .cart.routes import router as cart_router
 
 app.include_router(products_router)
 app.include_router(users_router)
 app.include_router(orders_router)
 app.include_router(me_router)
-app.include_router(map_router)
\ No newline at end of file
+app.include_router(map_router)
+app.include_router(cart_router)
\ No newline at end of file
@@ -2,59 +2,108 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
-from jose import JWTError, jwt
+import jwt
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from cachetools import TLRUCache
+import threading
+import time
  
 from .config import settings
 from .models import Role
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# `type` claim value marking refresh tokens, which may only be used at /refresh
+REFRESH_TOKEN_TYPE = "refresh"
+
 class TokenData(BaseModel):
     identity: str
     role: Optional[str] = None
+    token_type: Optional[str] = None
+
+# Decoded tokens keyed by the raw token string, stored as (exp, TokenData).
+# Each entry lives until the token's own `exp`, capped at _DECODE_CACHE_MAX_TTL,
+# and only successfully verified tokens are cached.
+_DECODE_CACHE_MAX_TTL = 60  # seconds
+_decode_cache = TLRUCache(
+    maxsize=10_000,
+    ttu=lambda _token, entry, now: min(entry[0], now + _DECODE_CACHE_MAX_TTL),
+    timer=time.time,
+)
+# decode_token (a sync dependency) runs in FastAPI's threadpool and cachetools caches aren't thread-safe
+_decode_cache_lock = threading.Lock()
+
+def _encode_token(claims: dict, expires_delta: timedelta, now: Optional[datetime] = None) -> str:
+    to_encode = {**claims, "exp": (now or datetime.utcnow()) + expires_delta}
+    return jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm="HS256")
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + settings.JWT_ACCESS_TOKEN_EXPIRES
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm="HS256")
-    return encoded_jwt
-
-def create_refresh_token(data: dict):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + settings.JWT_REFRESH_TOKEN_EXPIRES
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm="HS256")
-    return encoded_jwt
-
-def get_current_user(token: str = Depends(oauth2_scheme)) -> TokenData:
-    credentials_exception = HTTPException(
+    return _encode_token(data, expires_delta or settings.JWT_ACCESS_TOKEN_EXPIRES)
+
+def create_token_pair(sub: str, role: str) -> Tuple[str, str]:
+    """Mints an access token and a refresh token for the same identity and role in one pass."""
+    now = datetime.utcnow()
+    claims = {"sub": sub, "role": role}
+    access_token = _encode_token(claims, settings.JWT_ACCESS_TOKEN_EXPIRES, now)
+    refresh_token = _encode_token({**claims, "type": REFRESH_TOKEN_TYPE}, settings.JWT_REFRESH_TOKEN_EXPIRES, now)
+    return access_token, refresh_token
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_token(token: str = Depends(oauth2_scheme)) -> TokenData:
+    """Verifies any bearer token (access or refresh) and returns its claims."""
+    with _decode_cache_lock:
+        cached = _decode_cache.get(token)
+    if cached is not None:
+        return cached[1]
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=["HS256"])
         identity: str = payload.get("sub")
         role: str = payload.get("role")
         if identity is None:
-            raise credentials_exception
-        token_data = TokenData(identity=identity, role=role)
-    except JWTError:
-        raise credentials_exception
+            raise _credentials_exception()
+        token_data = TokenData(identity=identity, role=role, token_type=payload.get("type"))
+    except jwt.PyJWTError:
+        raise _credentials_exception()
+    exp = payload.get("exp")
+    if exp is not None:
+        with _decode_cache_lock:
+            _decode_cache[token] = (float(exp), token_data)
+    return token_data
+
+def get_current_user(token_data: TokenData = Depends(decode_token)) -> TokenData:
+    """Accepts access tokens only; refresh tokens are only good for /refresh."""
+    if token_data.token_type == REFRESH_TOKEN_TYPE:
+        raise _credentials_exception()
+    return token_data
+
+def get_refresh_token_user(token_data: TokenData = Depends(decode_token)) -> TokenData:
+    """
+    Accepts refresh tokens only. Refresh tokens issued before the `type` claim
+    carried neither `type` nor `role`, so those are still accepted.
+    """
+    is_legacy_refresh = token_data.token_type is None and token_data.role is None
+    if token_data.token_type != REFRESH_TOKEN_TYPE and not is_legacy_refresh:
+        raise _credentials_exception()
     return token_data
 
 def role_required(roles: List[Role]):
-    def role_checker(current_user: TokenData = Depends(get_current_user)):
-        if current_user.role not in [r.value for r in roles]:
+    # Resolved once per decorated endpoint rather than on every request
+    allowed_roles = frozenset(r.value for r in roles)
+    forbidden_detail = f"Access forbidden: This endpoint requires one of the following roles: {', '.join(r.value for r in roles)}"
+
+    def role_checker(current_user: TokenData = Depends(decode_token)):
+        # Refresh tokens carry the role claim too, but must not grant endpoint access
+        if current_user.token_type == REFRESH_TOKEN_TYPE or current_user.role not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"Access forbidden: This endpoint requires one of the following roles: {', '.join(r.value for r in roles)}",
+                detail=forbidden_detail,
             )
         return current_user
     return role_checker
\ No newline at end of file
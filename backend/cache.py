@@ -0,0 +1,57 @@
+# backend/cache.py
+import json
+import logging
+from typing import Optional
+from fastapi_cache import FastAPICache
+
+logger = logging.getLogger(__name__)
+
+# Product metadata (name/price) rarely changes, so a short TTL keeps hot
+# barcodes out of Mongo without serving stale data for long.
+PRODUCT_CACHE_TTL = 60  # seconds
+
+def product_cache_key(barcode: str) -> str:
+    return f"prod:{barcode}"
+
+# Namespace of the per-user get_cart responses cached by the `@cache` decorator
+CART_CACHE_NAMESPACE = "cart"
+
+def cart_cache_key(namespace: str, user_identity: str) -> str:
+    """Key of a user's cached cart; `namespace` is the decorator's `<prefix>:cart`."""
+    return f"{namespace}:{user_identity}:items"
+
+def _get_redis():
+    """Returns the Redis client shared with FastAPICache (set up in `lifespan`)."""
+    return FastAPICache.get_backend().redis
+
+# The product cache is an optimization only: on Redis errors, reads miss and
+# writes are skipped (like the `@cache` decorator does), so callers use Mongo.
+async def get_cached_product(barcode: str) -> Optional[dict]:
+    try:
+        cached = await _get_redis().get(product_cache_key(barcode))
+    except Exception:
+        logger.warning("Error reading cached product %s", barcode, exc_info=True)
+        return None
+    return json.loads(cached) if cached is not None else None
+
+async def set_cached_product(barcode: str, product: dict):
+    try:
+        await _get_redis().set(product_cache_key(barcode), json.dumps(product), ex=PRODUCT_CACHE_TTL)
+    except Exception:
+        logger.warning("Error caching product %s", barcode, exc_info=True)
+
+async def invalidate_cached_products(*barcodes: Optional[str]):
+    keys = [product_cache_key(bc) for bc in barcodes if bc]
+    if keys:
+        await _get_redis().delete(*keys)
+
+async def invalidate_cached_cart(user_identity: str):
+    # The key is exact, so a single DEL; FastAPICache.clear would scan the keyspace
+    # with a KEYS pattern built from the (unescaped) identity.
+    # Called after the cart write has committed, so a Redis error must not fail the
+    # request (a client retry would apply the write twice); the entry expires anyway.
+    namespace = f"{FastAPICache.get_prefix()}:{CART_CACHE_NAMESPACE}"
+    try:
+        await _get_redis().delete(cart_cache_key(namespace, user_identity))
+    except Exception:
+        logger.warning("Error invalidating cached cart of %s", user_identity, exc_info=True)
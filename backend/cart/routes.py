@@ -1,18 +1,158 @@
 # cart/routes.py
 
 from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi_cache.decorator import cache
+from typing import List, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from motor.motor_asyncio import AsyncIOMotorCollection
 from ..models import Product, CartOpRequest, CartOpResponse
 from ..auth import get_current_user, TokenData
-from backend.database import get_carts_collection, get_products_collection
+from ..cache import (
+    CART_CACHE_NAMESPACE,
+    cart_cache_key,
+    get_cached_product,
+    invalidate_cached_cart,
+    set_cached_product,
+)
+from ..database import get_carts_collection_async, get_products_collection_async
 
-router = APIRouter()
+router = APIRouter(
+    prefix="/api/cart",
+    tags=["Cart"]
+)
+
+# Only the fields Product needs; cart quantities come from the cart itself.
+CART_PRODUCT_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "subtitle": 1, "price": 1,
+    "currency": 1, "unit": 1, "product_img_url": 1, "barcode": 1,
+}
+# What a cart operation needs from the product: name/price, plus stock for adds.
+CART_NAME_PRICE_PROJECTION = {"_id": 0, "name": 1, "price": 1}
+CART_STOCK_PROJECTION = {"_id": 0, "name": 1, "price": 1, "quantity": 1}
+# Only what's needed to sum the cart's item count.
+CART_TOTAL_PROJECTION = {"_id": 0, "items.quantity": 1}
+
+
+def user_cart_key_builder(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None):
+    """
+    Scopes cached cart responses to the requesting user, so one user's cart is never
+    served to another. Keys look like `<prefix>:cart:<identity>:items`.
+    """
+    return cart_cache_key(namespace, kwargs['user'].identity)
+
+
+def _sum_item_quantities(cart: Optional[dict]) -> int:
+    """Returns the total quantity of items in a cart document."""
+    if not cart:
+        return 0
+    return sum(item.get("quantity", 0) for item in cart.get("items", []))
+
+
+async def _cart_total_items(carts_collection: AsyncIOMotorCollection, user_identity: str) -> int:
+    """Returns the total quantity of items in the user's cart, summed server-side."""
+    cursor = carts_collection.aggregate([
+        {"$match": {"user_identity": user_identity}},
+        {"$project": {"_id": 0, "total": {"$sum": "$items.quantity"}}},
+    ])
+    async for doc in cursor:
+        return doc["total"]
+    return 0
+
+
+async def _load_cart_product(
+    products_collection: AsyncIOMotorCollection, barcode: str, include_stock: bool
+) -> Optional[dict]:
+    """
+    Returns the product's name and price, plus its live `quantity` when `include_stock`
+    is set. Stock changes as orders are processed, so adds read all three in a single
+    Mongo query; removes only need name/price, which are served from Redis when hot.
+    """
+    if include_stock:
+        return await products_collection.find_one({"barcode": barcode}, CART_STOCK_PROJECTION)
+    product = await get_cached_product(barcode)
+    if product is not None:
+        return product
+    product = await products_collection.find_one({"barcode": barcode}, CART_NAME_PRICE_PROJECTION)
+    if product is not None:
+        await set_cached_product(barcode, product)
+    return product
+
+
+async def _increment_cart_item(
+    carts_collection: AsyncIOMotorCollection, user_identity: str, barcode: str, quantity: int
+) -> Optional[dict]:
+    """Increments an item already in the cart; returns the updated cart totals, or None if absent."""
+    return await carts_collection.find_one_and_update(
+        {"user_identity": user_identity, "items.barcode": barcode},
+        {"$inc": {"items.$.quantity": quantity}},
+        projection=CART_TOTAL_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+# Each failed attempt means a concurrent add created the cart or the item first,
+# so the next attempt finds it; a few attempts always suffice in practice.
+CART_ADD_ATTEMPTS = 3
+
+
+async def _add_cart_item(carts_collection: AsyncIOMotorCollection, user_identity: str, item: dict) -> dict:
+    """
+    Increments `item` if it is already in the cart, or pushes it otherwise (creating
+    the cart if needed). Returns the updated cart totals.
+    """
+    for attempt in range(CART_ADD_ATTEMPTS):
+        updated_cart = await _increment_cart_item(carts_collection, user_identity, item["barcode"], item["quantity"])
+        if updated_cart is not None:
+            return updated_cart
+        # Item not in cart yet (or no cart at all): add new item
+        try:
+            return await carts_collection.find_one_and_update(
+                {"user_identity": user_identity, "items.barcode": {"$ne": item["barcode"]}},
+                {"$push": {"items": item}},
+                projection=CART_TOTAL_PROJECTION,
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The filter missed and the unique user_identity index rejected the insert:
+            # a concurrent add created the cart (with this or another barcode) first.
+            # Mongo won't retry an upsert whose filter has `$ne`, so start over.
+            if attempt == CART_ADD_ATTEMPTS - 1:
+                raise
+
+
+@router.get("/op", response_model=List[Product])
+@cache(expire=30, namespace=CART_CACHE_NAMESPACE, key_builder=user_cart_key_builder)
+async def get_cart(
+    user: TokenData = Depends(get_current_user),
+    carts_collection: AsyncIOMotorCollection = Depends(get_carts_collection_async),
+    products_collection: AsyncIOMotorCollection = Depends(get_products_collection_async),
+):
+    """
+    Returns the current user's cart items merged with their product details.
+    Products are fetched in one batched `$in` query.
+    """
+    user_cart = await carts_collection.find_one({"user_identity": user.identity}, {"_id": 0, "items": 1})
+    if not user_cart:
+        return []
+    quantities = {item["barcode"]: item.get("quantity", 0) for item in user_cart.get("items", [])}
+
+    # Plain dicts: FastAPI validates them against `response_model` either way, so
+    # building Product instances here would only add a dump/re-validate round trip.
+    cursor = products_collection.find({"barcode": {"$in": list(quantities)}}, CART_PRODUCT_PROJECTION)
+    return [
+        {**meta, "quantity": max(quantities[meta["barcode"]], 0)}
+        async for meta in cursor
+    ]
 
 
 @router.post("/op", response_model=CartOpResponse)
 async def cart_operation(
     request: CartOpRequest,
-    user: TokenData = Depends(get_current_user)
+    user: TokenData = Depends(get_current_user),
+    carts_collection: AsyncIOMotorCollection = Depends(get_carts_collection_async),
+    products_collection: AsyncIOMotorCollection = Depends(get_products_collection_async),
 ):
     """
     Execute cart operation (add/remove items) with transactional safety.
@@ -23,12 +163,10 @@ async def cart_operation(
     - Atomic cart operations
     """
     try:
-        # Get MongoDB collections
-        products_collection = get_products_collection()
-        carts_collection = get_carts_collection()
-        
         # 1. Validate product exists
-        product = await products_collection.find_one({"barcode": request.barcode})
+        product = await _load_cart_product(
+            products_collection, request.barcode, include_stock=request.action == "add"
+        )
         if not product:
             return CartOpResponse(
                 success=False,
@@ -36,75 +174,55 @@ async def cart_operation(
                 cart_total_items=0
             )
         
-        # 2. Get current cart
-        user_cart = await carts_collection.find_one({"user_identity": user.identity})
-        if not user_cart:
-            user_cart = {"user_identity": user.identity, "items": []}
-        
-        # Find item in cart
-        cart_item = None
-        for item in user_cart.get("items", []):
-            if item.get("barcode") == request.barcode:
-                cart_item = item
-                break
-        
-        # 3. Validate operation based on action
+        # 2. Execute operation atomically.
+        # Single-document updates are atomic in MongoDB, so each guard lives in the
+        # update filter itself instead of in a separate read of the cart.
         if request.action == "add":
             # Check stock availability
             if product.get("quantity", 0) < request.quantity:
                 return CartOpResponse(
                     success=False,
                     message=f"Insufficient stock. Available: {product.get('quantity', 0)}, Requested: {request.quantity}",
-                    cart_total_items=sum(item.get("quantity", 0) for item in user_cart.get("items", []))
+                    cart_total_items=await _cart_total_items(carts_collection, user.identity)
                 )
+            new_item = {
+                "barcode": request.barcode,
+                "name": product.get("name"),
+                "price": product.get("price"),
+                "quantity": request.quantity
+            }
+            updated_cart = await _add_cart_item(carts_collection, user.identity, new_item)
         elif request.action == "remove":
-            # Check if enough items in cart
-            current_cart_quantity = cart_item.get("quantity", 0) if cart_item else 0
-            if current_cart_quantity < request.quantity:
+            # Decrease quantity, guarded on enough items being in the cart
+            result = await carts_collection.update_one(
+                {
+                    "user_identity": user.identity,
+                    "items": {"$elemMatch": {"barcode": request.barcode, "quantity": {"$gte": request.quantity}}},
+                },
+                {"$inc": {"items.$.quantity": -request.quantity}}
+            )
+            if result.modified_count == 0:
+                user_cart = await carts_collection.find_one({"user_identity": user.identity}) or {}
+                items = user_cart.get("items", [])
+                current_cart_quantity = next(
+                    (item.get("quantity", 0) for item in items if item.get("barcode") == request.barcode), 0
+                )
                 return CartOpResponse(
                     success=False,
                     message=f"Not enough items in cart. Available: {current_cart_quantity}, Requested: {request.quantity}",
-                    cart_total_items=sum(item.get("quantity", 0) for item in user_cart.get("items", []))
-                )
-        
-        # 4. Execute operation atomically
-        if request.action == "add":
-            if cart_item:
-                # Update existing item
-                await carts_collection.update_one(
-                    {"user_identity": user.identity, "items.barcode": request.barcode},
-                    {"$inc": {"items.$.quantity": request.quantity}}
-                )
-            else:
-                # Add new item
-                new_item = {
-                    "barcode": request.barcode,
-                    "name": product.get("name"),
-                    "price": product.get("price"),
-                    "quantity": request.quantity
-                }
-                await carts_collection.update_one(
-                    {"user_identity": user.identity},
-                    {"$push": {"items": new_item}},
-                    upsert=True
-                )
-        elif request.action == "remove":
-            if cart_item.get("quantity", 0) == request.quantity:
-                # Remove item completely
-                await carts_collection.update_one(
-                    {"user_identity": user.identity},
-                    {"$pull": {"items": {"barcode": request.barcode}}}
-                )
-            else:
-                # Decrease quantity
-                await carts_collection.update_one(
-                    {"user_identity": user.identity, "items.barcode": request.barcode},
-                    {"$inc": {"items.$.quantity": -request.quantity}}
+                    cart_total_items=_sum_item_quantities(user_cart)
                 )
+            # Remove item completely once its quantity drops to zero
+            updated_cart = await carts_collection.find_one_and_update(
+                {"user_identity": user.identity},
+                {"$pull": {"items": {"barcode": request.barcode, "quantity": {"$lte": 0}}}},
+                projection=CART_TOTAL_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
         
-        # 5. Get updated cart for response
-        updated_cart = await carts_collection.find_one({"user_identity": user.identity})
-        total_items = sum(item.get("quantity", 0) for item in updated_cart.get("items", []))
+        # 3. Invalidate the cached cart; the updated cart came back from the write itself
+        await invalidate_cached_cart(user.identity)
+        total_items = _sum_item_quantities(updated_cart)
         
         return CartOpResponse(
             success=True,
@@ -1,5 +1,6 @@
 # backend/database.py
-from pymongo import MongoClient, ASCENDING, collection
+from pymongo import MongoClient, ASCENDING, DESCENDING, collection
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
 from .config import settings
 import random
 import os
@@ -10,6 +11,10 @@ import json
 client = MongoClient(settings.MONGO_URI)
 db = client["shopping_cart_db"]
 
+# Motor client for `async def` handlers, so Mongo I/O doesn't block the event loop.
+async_client = AsyncIOMotorClient(settings.MONGO_URI)
+async_db = async_client["shopping_cart_db"]
+
 # --- Collection Getters (for Dependency Injection) ---
 def get_products_collection() -> collection.Collection:
     return db["products"]
@@ -24,11 +29,33 @@ def get_map_collection() -> collection.Collection:
     return db["map"]
 def get_carts_collection()-> collection.Collection:
     return db['carts']
+
+# --- Async Collection Getters (Motor) ---
+def get_products_collection_async() -> AsyncIOMotorCollection:
+    return async_db["products"]
+
+def get_users_collection_async() -> AsyncIOMotorCollection:
+    return async_db["users"]
+
+def get_carts_collection_async() -> AsyncIOMotorCollection:
+    return async_db["carts"]
+
+def get_orders_collection_async() -> AsyncIOMotorCollection:
+    return async_db["order_history"]
+
 # --- Database Helpers ---
 def ensure_indexes():
-    """Creates unique indexes for collections if they don't exist."""
+    """Creates the indexes backing the app's lookups if they don't exist."""
     get_products_collection().create_index([("id", ASCENDING)], unique=True)
+    get_products_collection().create_index([("barcode", ASCENDING)])
     get_users_collection().create_index([("email", ASCENDING)], unique=True)
+    get_carts_collection().create_index([("user_identity", ASCENDING)], unique=True)
+    # Order history listing: user (equality), newest first (sort), then status, whose
+    # `$ne` is a range predicate and must come after the sort key to avoid an in-memory SORT
+    get_orders_collection().create_index(
+        [("user_identity", ASCENDING), ("created_at", DESCENDING), ("status", ASCENDING)]
+    )
+    get_orders_collection().create_index([("order_id", ASCENDING)], unique=True)
     print("Database indexes ensured.")
 
 PRODUCT_NAMES = [
@@ -39,8 +66,9 @@ SUBTITLES = ["Fresh", "Organic", "Imported", "Local", "Premium", "Budget"]
 UNITS = ["each", "kg", "pack", "bottle", "box"]
 random.seed(42)
 
-def random_location():
-    return {"x": 5200, "y": 2400}
+# Every product currently sits at the same map location; share one dict rather
+# than building a fresh one per location entry.
+DEFAULT_LOCATION = {"x": 5200, "y": 2400}
 import string
 def random_barcode(length=13):
     """Generate a random numeric barcode string (EAN-13 style)."""
@@ -63,14 +91,14 @@ def generate_products(n=20):
             "quantity": random.randint(1, 50),
             "unit": random.choice(UNITS),
             "product_img_url": "https://via.placeholder.com/80/cccccc/000000?Text=Product",
-            "location": [random_location() for _ in range(random.randint(1, 3))],
+            "location": [DEFAULT_LOCATION] * random.randint(1, 3),
             "barcode": None
         }
         products.append(product)
     return products
 
 def seed_database_if_empty():
-    """Clears and reseeds the products and map collections with initial data, only in development."""
+    """Seeds the products and map collections with initial data if products is empty, only in development."""
     if getattr(settings, "APP_ENV", "development") != "development":
         print("Skipping database seeding: not in development environment.")
         return
@@ -79,8 +107,11 @@ def seed_database_if_empty():
     # Always ensure text index exists
     products_collection.create_index([("name", "text")])
 
-    # Clear collections before reseeding
-    products_collection.delete_many({})
+    if products_collection.estimated_document_count() > 0:
+        print("Skipping database seeding: products collection is not empty.")
+        return
+
+    # Clear any stale map before reseeding
     map_collection.delete_many({})
 
     # Try to load products from JSONL file
@@ -99,7 +130,7 @@ def seed_database_if_empty():
                         prod.setdefault("barcode", random_barcode())
                         prod.setdefault("unit", "each")
                         prod.setdefault("product_img_url", None)
-                        prod.setdefault("location", [random_location() for _ in range(random.randint(1, 3))])
+                        prod.setdefault("location", [DEFAULT_LOCATION] * random.randint(1, 3))
                         loaded_products.append(prod)
                     except Exception as e:
                         print(f"Error loading product from JSONL: {e}")
@@ -111,7 +142,7 @@ def seed_database_if_empty():
         print(f"Loaded {len(loaded_products)} products from JSONL.")
 
     print("Seeding database with products...")
-    products_collection.insert_many(loaded_products)
+    products_collection.insert_many(loaded_products, ordered=False)
     print("Database seeded.")
 
     # Seed default_map.png
@@ -1,7 +1,6 @@
 # models.py
-from typing import List, Optional
+from typing import List, Literal, Optional
 from enum import Enum
-from decimal import Decimal
 from pydantic import BaseModel, Field, model_validator, EmailStr
 from datetime import datetime
 
@@ -50,6 +49,21 @@ class ProductUpdate(BaseModel):
     barcode: Optional[str] = None
 
 
+# --- Cart Models ---
+
+
+class CartOpRequest(BaseModel):
+    barcode: str
+    action: Literal["add", "remove"]
+    quantity: int = Field(default=1, gt=0)
+
+
+class CartOpResponse(BaseModel):
+    success: bool
+    message: str
+    cart_total_items: int
+
+
 # --- User and Auth Models ---
 
 
@@ -85,38 +99,38 @@ class OrderStatus(str, Enum):
 
 
 class CheckoutPayload(BaseModel):
-    """Data model for the entire checkout payload sent from the client."""
+    """Fields shared by the checkout payload and stored orders."""
 
     items: List[Product]
     shipping_cost: float = Field(..., ge=0)
     subtotal: float = Field(..., ge=0)
     total_cost: float = Field(..., ge=0)
 
+
+class CheckoutPayloadIn(CheckoutPayload):
+    """
+    Data model for the entire checkout payload sent from the client.
+    Totals are only re-checked here, on ingress, not when stored orders are loaded.
+    """
+
     @model_validator(mode="after")
-    def validate_and_recalculate_totals(self) -> "CheckoutPayload":
+    def validate_and_recalculate_totals(self) -> "CheckoutPayloadIn":
         """
         Validates that the subtotal and total_cost sent by the client are correct.
         This is a security measure to prevent price manipulation from the client-side.
         """
-        # Use Decimal for precision with currency to avoid floating point errors
-        calculated_subtotal = sum(
-            Decimal(str(item.price)) * Decimal(item.quantity) for item in self.items
-        )
-        calculated_total = calculated_subtotal + Decimal(str(self.shipping_cost))
-
-        # Compare with a small tolerance for floating point inaccuracies
-        if not abs(Decimal(str(self.subtotal)) - calculated_subtotal) < Decimal(
-            "0.01"
-        ):
+        # Work in integer cents to avoid floating point errors without per-item Decimals
+        calculated_subtotal = sum(round(item.price * 100) * item.quantity for item in self.items)
+        calculated_total = calculated_subtotal + round(self.shipping_cost * 100)
+
+        if round(self.subtotal * 100) != calculated_subtotal:
             raise ValueError(
-                f"Subtotal mismatch. Client sent {self.subtotal}, server calculated {calculated_subtotal:.2f}"
+                f"Subtotal mismatch. Client sent {self.subtotal}, server calculated {calculated_subtotal / 100:.2f}"
             )
 
-        if not abs(Decimal(str(self.total_cost)) - calculated_total) < Decimal(
-            "0.01"
-        ):
+        if round(self.total_cost * 100) != calculated_total:
             raise ValueError(
-                f"Total cost mismatch. Client sent {self.total_cost}, server calculated {calculated_total:.2f}"
+                f"Total cost mismatch. Client sent {self.total_cost}, server calculated {calculated_total / 100:.2f}"
             )
 
         return self
@@ -1,18 +1,18 @@
 # backend/orders/routes.py
-from fastapi import APIRouter, HTTPException, status, Depends, Body
+from fastapi import APIRouter, HTTPException, status, Depends, Body, Request
 from pymongo import DESCENDING, collection
-import uuid
+from uuid6 import uuid7
 from datetime import datetime
 from typing import List, Optional
 import io
-import qrcode
-import qrcode.image.svg
+import asyncio
+import segno
 import httpx
 
 import hmac
 import hashlib
 from ..models import (
-    CheckoutPayload,
+    CheckoutPayloadIn,
     OrderHistoryItem,
     OrderStatus,
     VietQRWebhookPayload,
@@ -21,7 +21,8 @@ from ..models import (
     VietQRGenerateResponse,
     OrderStatusResponse,
 )
-from ..database import get_orders_collection
+from motor.motor_asyncio import AsyncIOMotorCollection
+from ..database import get_orders_collection, get_orders_collection_async
 from .tasks import process_order
 from ..models import Role
 from .. import auth, config
@@ -30,9 +31,30 @@ router = APIRouter(
     prefix="/api/orders",
     tags=["Orders"]
 )
+
+# Keyed once at import; each webhook copies it instead of re-keying HMAC-SHA256.
+_webhook_hmac_template = hmac.new(
+    config.settings.VIETQR_WEBHOOK_SECRET_KEY.encode(), digestmod=hashlib.sha256
+)
+
+def generate_vietqr_webhook_signature(payload: VietQRWebhookPayload) -> str:
+    """Computes the expected HMAC-SHA256 signature of a VietQR webhook payload."""
+    payload_string = f"{payload.paymentRequestId}{payload.state.value}{payload.amount}{payload.referenceId}{payload.extraData}"
+    signature = _webhook_hmac_template.copy()
+    signature.update(payload_string.encode())
+    return signature.hexdigest()
+
+def _render_qr_svg(qr_code_data: str) -> str:
+    """Renders the VietQR payload as an SVG string in memory."""
+    qr = segno.make(qr_code_data, error="m")
+    stream = io.BytesIO()
+    qr.save(stream, kind="svg", scale=4, xmldecl=False)
+    return stream.getvalue().decode('utf-8')
+
 @router.post('/checkout')
 async def initiate_checkout_and_generate_qr(
-    cart_data: CheckoutPayload,
+    cart_data: CheckoutPayloadIn,
+    request: Request,
     current_user: auth.TokenData = Depends(auth.role_required([Role.SHOP_CLIENT, Role.GUEST])),
     orders_collection: collection.Collection = Depends(get_orders_collection),
 ):
@@ -41,7 +63,8 @@ async def initiate_checkout_and_generate_qr(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot checkout with an empty cart")
 
     user_identity = current_user.identity
-    order_id = str(uuid.uuid4())
+    # Time-ordered IDs keep inserts at the tail of the order_id index
+    order_id = str(uuid7())
     print(f"--- [API] Initiating payment for order {order_id} by {user_identity} ---")
     
     # Create a pending order record in the database
@@ -66,31 +89,29 @@ async def initiate_checkout_and_generate_qr(
 
     qr_svg_string = None
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://api.vietqr.io/v2/generate",
-                json=vietqr_request_data.model_dump(),
-                timeout=10.0 # It's good practice to set a timeout
+        # Reuse the app-wide pooled client to skip a TCP+TLS handshake per checkout
+        client = request.app.state.http
+        response = await client.post(
+            "https://api.vietqr.io/v2/generate",
+            json=vietqr_request_data.model_dump(),
+            timeout=10.0 # It's good practice to set a timeout
+        )
+        response.raise_for_status()
+        api_response = VietQRGenerateResponse.model_validate(response.json())
+
+        if api_response.code != "00" or not api_response.data:
+            print(f"--- [API] VietQR API error for order {order_id}: {api_response.desc} ---")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Failed to generate QR code: {api_response.desc}"
             )
-            response.raise_for_status()
-            api_response = VietQRGenerateResponse.model_validate(response.json())
-
-            if api_response.code != "00" or not api_response.data:
-                print(f"--- [API] VietQR API error for order {order_id}: {api_response.desc} ---")
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail=f"Failed to generate QR code: {api_response.desc}"
-                )
-            
-            # The VietQR API gives us the raw data for the QR code.
-            # We can use this to generate our own SVG image.
-            qr_code_data = api_response.data.qrCode
-            
-            # Generate SVG image in memory
-            img = qrcode.make(qr_code_data, image_factory=qrcode.image.svg.SvgPathImage)
-            stream = io.BytesIO()
-            img.save(stream)
-            qr_svg_string = stream.getvalue().decode('utf-8')
+        
+        # The VietQR API gives us the raw data for the QR code.
+        # We can use this to generate our own SVG image.
+        qr_code_data = api_response.data.qrCode
+        
+        # Generate SVG image in memory, off the event loop since it's CPU-bound
+        qr_svg_string = await asyncio.to_thread(_render_qr_svg, qr_code_data)
     except httpx.RequestError as e:
         print(f"--- [API] HTTP request to VietQR API failed for order {order_id}: {e} ---")
         raise HTTPException(
@@ -105,17 +126,18 @@ async def initiate_checkout_and_generate_qr(
     }
 
 @router.get('/history', response_model=List[OrderHistoryItem])
-def get_order_history(
+async def get_order_history(
     current_user: auth.TokenData = Depends(auth.role_required([Role.SHOP_CLIENT, Role.GUEST])),
-    orders_collection: collection.Collection = Depends(get_orders_collection),
+    orders_collection: AsyncIOMotorCollection = Depends(get_orders_collection_async),
 ):
     """Retrieves the order history for the currently logged-in user."""
     user_identity = current_user.identity
     try:
-        history = list(orders_collection.find(
+        cursor = orders_collection.find(
             {"user_identity": user_identity, "status": {"$ne": OrderStatus.PENDING}},
             {'_id': 0}
-        ).sort("created_at", DESCENDING))
+        ).sort("created_at", DESCENDING)
+        history = [doc async for doc in cursor]
         return history
     except Exception as e:
         print(f"Error fetching order history for {user_identity}: {e}")
@@ -139,3 +161,46 @@ def get_order_status(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
     
     return order
+
+@router.post('/webhook/payment_confirmation')
+def receive_payment_webhook(
+    payload: VietQRWebhookPayload,
+    orders_collection: collection.Collection = Depends(get_orders_collection),
+):
+    """
+    Receives payment confirmations from VietQR. On a valid, successful payment the
+    order is marked as paid and handed to the Celery worker for inventory processing.
+    """
+    # Constant-time comparison so the signature check doesn't leak timing
+    if not hmac.compare_digest(generate_vietqr_webhook_signature(payload), payload.signature):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid signature")
+
+    order_id = payload.referenceId
+    order = orders_collection.find_one({"order_id": order_id}, {"_id": 0, "total_cost": 1})
+    if not order:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+
+    if payload.state != VietQRTransactionState.SUCCESS:
+        orders_collection.update_one(
+            {"order_id": order_id, "status": OrderStatus.PENDING}, {"$set": {"status": OrderStatus.FAILED}}
+        )
+        return {"message": f"Payment for order {order_id} failed."}
+
+    if payload.amount != int(order["total_cost"]):
+        print(f"--- [API] Amount mismatch for order {order_id}: expected {int(order['total_cost'])}, got {payload.amount} ---")
+        orders_collection.update_one(
+            {"order_id": order_id, "status": OrderStatus.PENDING}, {"$set": {"status": OrderStatus.FAILED}}
+        )
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Amount mismatch")
+
+    # Only a pending order can change state, so a replayed webhook can neither re-queue
+    # a paid order nor fail one whose inventory was already taken
+    result = orders_collection.update_one(
+        {"order_id": order_id, "status": OrderStatus.PENDING},
+        {"$set": {"status": OrderStatus.PAID}}
+    )
+    if result.modified_count == 0:
+        return {"message": f"Order {order_id} was already processed."}
+
+    process_order.delay(order_id)
+    return {"message": f"Payment for order {order_id} confirmed. Processing inventory."}
@@ -1,15 +1,44 @@
 # backend/orders/tasks.py
 from celery import shared_task
-from pymongo import MongoClient
-import redis
+from celery.utils.log import get_task_logger
+from pymongo import MongoClient, UpdateOne
 from datetime import datetime
 
 from .. import config
-from ..models import OrderHistoryItem, OrderStatus
+from ..models import OrderStatus
 
-# --- Helper function to get a database client within the worker ---
-def get_db_client():
-    return MongoClient(config.MONGO_URI)
+logger = get_task_logger(__name__)
+
+# --- Database client shared by all tasks in a worker process ---
+# Created lazily so each forked worker process opens its own connection pool,
+# then reused for every task instead of connecting and closing per order.
+_client = None
+
+def get_db_client() -> MongoClient:
+    global _client
+    if _client is None:
+        _client = MongoClient(config.settings.MONGO_URI, maxPoolSize=50)
+    return _client
+
+def get_db():
+    """Returns the app database on the shared client (tests point this at their own)."""
+    return get_db_client()["shopping_cart_db"]
+
+class InsufficientStockError(Exception):
+    """Raised inside the inventory transaction to abort it when any item is short on stock."""
+
+def _reserve_inventory(session, products_collection, order_history_collection, order_id: str, quantities: dict):
+    """Decrements stock for every product and marks the order completed, within `session`'s transaction."""
+    result = products_collection.bulk_write([
+        UpdateOne({"id": product_id, "quantity": {"$gte": quantity}}, {"$inc": {"quantity": -quantity}})
+        for product_id, quantity in quantities.items()
+    ], ordered=False, session=session)
+    # matched, not modified: a zero-quantity line is a no-op $inc that Mongo doesn't count as modified
+    if result.matched_count != len(quantities):
+        raise InsufficientStockError(f"Insufficient stock for order {order_id}.")
+    order_history_collection.update_one(
+        {"order_id": order_id}, {"$set": {"status": OrderStatus.COMPLETED}}, session=session
+    )
 
 @shared_task(bind=True)
 def process_order(self, order_id: str):
@@ -17,43 +46,37 @@ def process_order(self, order_id: str):
     Processes a paid order by decrementing stock quantities in the database.
     This task is designed to be transactional and safe for concurrency.
     """
-    print(f"\n--- [CELERY WORKER] PROCESSING INVENTORY FOR ORDER {order_id} ---")
+    logger.info("Processing inventory for order %s", order_id)
     
-    client = get_db_client()
-    db = client["shopping_cart_db"]
+    db = get_db()
     products_collection = db["products"]
     order_history_collection = db["order_history"]
     
-    order_data = order_history_collection.find_one({"order_id": order_id})
+    order_data = order_history_collection.find_one(
+        {"order_id": order_id}, {"_id": 0, "status": 1, "items.id": 1, "items.quantity": 1}
+    )
     if not order_data or order_data.get("status") != OrderStatus.PAID:
-        print(f"--- [CELERY WORKER] ERROR: Order {order_id} not found or not in 'paid' state. Aborting. ---")
+        logger.error("Order %s not found or not in 'paid' state. Aborting.", order_id)
         return {"status": "failure", "message": "Order not found or not paid."}
 
-    order = OrderHistoryItem.model_validate(order_data)
-
-    updates_to_perform = []
-    for item in order.items:
-        result = products_collection.update_one(
-            {"id": item.id, "quantity": {"$gte": item.quantity}},
-            {"$inc": {"quantity": -item.quantity}}
-        )
-        
-        if result.matched_count == 0:
-            print(f"--- [CELERY WORKER] FAILED: Insufficient stock for product ID {item.id}. Rolling back and marking order as failed. ---")
-            order_history_collection.update_one({"order_id": order_id}, {"$set": {"status": OrderStatus.FAILED}})
-            for u_item in updates_to_perform:
-                products_collection.update_one(
-                    {"id": u_item.id},
-                    {"$inc": {"quantity": u_item.quantity}}
-                )
-            return {"status": "failure", "message": f"Insufficient stock for {item.name}."}
-        
-        updates_to_perform.append(item)
-        print(f"--- [CELERY WORKER] Reserved {item.quantity} of '{item.name}' (ID: {item.id}).")
-
-    # If all items are reserved, mark the order as completed
-    order_history_collection.update_one({"order_id": order_id}, {"$set": {"status": OrderStatus.COMPLETED}})
-
-    client.close()
-    print(f"--- [CELERY WORKER] INVENTORY FOR ORDER {order_id} PROCESSED SUCCESSFULLY ---\n")
+    # The order was validated at checkout; only ids and quantities are needed here,
+    # so read them straight from the document instead of re-validating it.
+    # Repeated line items are merged so each product gets a single conditional decrement.
+    quantities = {}
+    for item in order_data["items"]:
+        quantities[item["id"]] = quantities.get(item["id"], 0) + item["quantity"]
+
+    # Decrement all stock and complete the order in one transaction: either every
+    # decrement commits or none do, so there is nothing to roll back by hand.
+    try:
+        with db.client.start_session() as session:
+            session.with_transaction(
+                lambda s: _reserve_inventory(s, products_collection, order_history_collection, order_id, quantities)
+            )
+    except InsufficientStockError:
+        logger.warning("Insufficient stock for order %s. Transaction aborted, marking order as failed.", order_id)
+        order_history_collection.update_one({"order_id": order_id}, {"$set": {"status": OrderStatus.FAILED}})
+        return {"status": "failure", "message": "Insufficient stock for one or more items."}
+
+    logger.info("Reserved %d products for order %s. Inventory processed successfully.", len(quantities), order_id)
     return {"status": "success", "message": "Inventory updated and order completed."}
\ No newline at end of file
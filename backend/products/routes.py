@@ -4,6 +4,7 @@ from pymongo import DESCENDING, collection
 from typing import List
 from fastapi_cache.decorator import cache
 
+from ..cache import invalidate_cached_products
 from ..database import get_products_collection
 from ..models import Product, ProductCreate, ProductUpdate
 from ..models import Role
@@ -45,6 +46,7 @@ async def create_product(
     new_product_doc['id'] = get_next_product_id(products_collection)
     new_product = Product.model_validate(new_product_doc)
     products_collection.insert_one(new_product.model_dump())
+    await invalidate_cached_products(new_product.barcode)
     
     # In FastAPI, cache invalidation is often handled differently,
     # e.g., via a separate endpoint or event system. For simplicity, we'll skip explicit clearing.
@@ -87,13 +89,17 @@ async def update_product(
     if not update_fields:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No update fields provided")
         
-    result = products_collection.update_one({"id": product_id}, {"$set": update_fields})
+    previous_product = products_collection.find_one_and_update(
+        {"id": product_id}, {"$set": update_fields}, projection={"_id": 0, "barcode": 1}
+    )
     
-    if result.matched_count == 0:
+    if previous_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
         
-    print("--- Product updated. Cache will expire naturally. ---")
     updated_product = products_collection.find_one({"id": product_id}, {'_id': 0})
+    # The barcode may have changed, so drop cache entries for both old and new barcodes
+    await invalidate_cached_products(previous_product.get("barcode"), updated_product.get("barcode"))
+    print("--- Product updated. Barcode cache invalidated, list cache will expire naturally. ---")
     return updated_product
 
 @router.delete('/{product_id}', status_code=status.HTTP_204_NO_CONTENT)
@@ -103,9 +109,10 @@ async def delete_product(
     products_collection: collection.Collection = Depends(get_products_collection),
 ):
     """Deletes a product from the database."""
-    result = products_collection.delete_one({"id": product_id})
-    if result.deleted_count == 0:
+    deleted_product = products_collection.find_one_and_delete({"id": product_id}, projection={"_id": 0, "barcode": 1})
+    if deleted_product is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
     
-    print("--- Product deleted. Cache will expire naturally. ---")
+    await invalidate_cached_products(deleted_product.get("barcode"))
+    print("--- Product deleted. Barcode cache invalidated, list cache will expire naturally. ---")
     return
\ No newline at end of file
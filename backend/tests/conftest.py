@@ -1,5 +1,8 @@
+import os
 import pytest
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from motor.motor_asyncio import AsyncIOMotorClient
 from fastapi.testclient import TestClient
 from backend.app import app
 from backend import config
@@ -7,6 +10,10 @@ from backend.database import (
     get_products_collection,
     get_users_collection,
     get_orders_collection,
+    get_orders_collection_async,
+    get_users_collection_async,
+    get_products_collection_async,
+    get_carts_collection_async,
 )
 from backend.models import Role
 import hmac
@@ -14,6 +21,15 @@ import hashlib
 
 # Use a dedicated test database name
 TEST_MONGO_URI = "mongodb://localhost:27017/test_shopping_cart_db"
+# process_order runs a multi-document transaction, which a standalone mongod rejects,
+# so its tests need a replica set (e.g. `mongod --replSet rs0` after `rs.initiate()`).
+TEST_MONGO_RS_URI = os.environ.get("TEST_MONGO_RS_URI", "mongodb://localhost:27017/?directConnection=true")
+
+SEED_PRODUCTS = [
+    {'id': 1, 'name': 'Fifa 19', 'subtitle': 'PS4', 'price': 1500000, 'currency': 'VND', 'quantity': 10, 'unit': 'pack', 'product_img_url': 'https://via.placeholder.com/80/cccccc/000000?Text=Game', 'barcode': '8930000000001'},
+    {'id': 2, 'name': 'Glacier White 500GB', 'subtitle': 'PS4', 'price': 8000000, 'currency': 'VND', 'quantity': 5, 'unit': 'each', 'product_img_url': 'https://via.placeholder.com/80/f0f0f0/000000?Text=Console', 'barcode': '8930000000002'},
+    {'id': 3, 'name': 'Platinum Headset', 'subtitle': 'PS4', 'price': 2500000, 'currency': 'VND', 'quantity': 20, 'unit': 'each', 'product_img_url': 'https://via.placeholder.com/80/e0e0e0/000000?Text=Accessory', 'barcode': '8930000000003'},
+]
 
 @pytest.fixture(scope="session")
 def test_db():
@@ -24,8 +40,15 @@ def test_db():
     client.drop_database("test_shopping_cart_db")
     client.close()
 
+@pytest.fixture(scope="session")
+def async_test_db():
+    """Motor handle on the same test database, for async endpoints."""
+    client = AsyncIOMotorClient(TEST_MONGO_URI)
+    yield client.get_database("test_shopping_cart_db")
+    client.close()
+
 @pytest.fixture(scope="function", autouse=True)
-def setup_test_db(test_db):
+def setup_test_db(test_db, async_test_db):
     """
     - Overrides database dependencies to use the test database.
     - Cleans all collections and seeds products before each test.
@@ -33,27 +56,57 @@ def setup_test_db(test_db):
     def override_get_products(): return test_db["products"]
     def override_get_users(): return test_db["users"]
     def override_get_orders(): return test_db["order_history"]
+    def override_get_orders_async(): return async_test_db["order_history"]
+    def override_get_users_async(): return async_test_db["users"]
+    def override_get_products_async(): return async_test_db["products"]
+    def override_get_carts_async(): return async_test_db["carts"]
 
     app.dependency_overrides[get_products_collection] = override_get_products
     app.dependency_overrides[get_users_collection] = override_get_users
     app.dependency_overrides[get_orders_collection] = override_get_orders
+    app.dependency_overrides[get_orders_collection_async] = override_get_orders_async
+    app.dependency_overrides[get_users_collection_async] = override_get_users_async
+    app.dependency_overrides[get_products_collection_async] = override_get_products_async
+    app.dependency_overrides[get_carts_collection_async] = override_get_carts_async
 
     for c in test_db.list_collection_names():
         test_db.drop_collection(c)
+    # Duplicate registrations are rejected by this index rather than a pre-check
+    test_db.users.create_index("email", unique=True)
+    test_db.carts.create_index("user_identity", unique=True)
 
-    # Seed initial products for tests that need them
-    initial_products = [
-        {'id': 1, 'name': 'Fifa 19', 'subtitle': 'PS4', 'price': 1500000, 'currency': 'VND', 'quantity': 10, 'unit': 'pack', 'product_img_url': 'https://via.placeholder.com/80/cccccc/000000?Text=Game'},
-        {'id': 2, 'name': 'Glacier White 500GB', 'subtitle': 'PS4', 'price': 8000000, 'currency': 'VND', 'quantity': 5, 'unit': 'each', 'product_img_url': 'https://via.placeholder.com/80/f0f0f0/000000?Text=Console'},
-        {'id': 3, 'name': 'Platinum Headset', 'subtitle': 'PS4', 'price': 2500000, 'currency': 'VND', 'quantity': 20, 'unit': 'each', 'product_img_url': 'https://via.placeholder.com/80/e0e0e0/000000?Text=Accessory'},
-    ]
-    test_db.products.insert_many(initial_products)
+    # Seed initial products for tests that need them (copies: insert_many adds `_id`)
+    test_db.products.insert_many([dict(p) for p in SEED_PRODUCTS])
     
     yield # Run the test
     
     # Clear overrides after test
     app.dependency_overrides = {}
 
+@pytest.fixture(scope="session")
+def rs_test_client():
+    """Client for a replica-set MongoDB; skips the requesting tests if none is reachable."""
+    client = MongoClient(TEST_MONGO_RS_URI, serverSelectionTimeoutMS=2000)
+    try:
+        is_replica_set = "setName" in client.admin.command("hello")
+    except PyMongoError:
+        is_replica_set = False
+    if not is_replica_set:
+        client.close()
+        pytest.skip(f"Transactions need a replica-set MongoDB; none at TEST_MONGO_RS_URI={TEST_MONGO_RS_URI}")
+    yield client
+    client.drop_database("test_shopping_cart_tasks_db")
+    client.close()
+
+@pytest.fixture(scope="function")
+def rs_test_db(rs_test_client):
+    """A clean, seeded database on the replica set, for transactional code."""
+    rs_db = rs_test_client.get_database("test_shopping_cart_tasks_db")
+    for c in rs_db.list_collection_names():
+        rs_db.drop_collection(c)
+    rs_db.products.insert_many([dict(p) for p in SEED_PRODUCTS])
+    return rs_db
+
 @pytest.fixture(scope="session")
 def client():
     """A test client for the app, created once per session."""
@@ -69,7 +122,7 @@ def db(test_db):
 def register_and_login_user(client):
     """Helper to register and log in a user, returning their tokens and identity."""
     def _register_and_login(email, password, is_admin=False):
-        register_email = config.ADMIN_EMAIL if is_admin else email
+        register_email = config.settings.ADMIN_EMAIL if is_admin else email
 
         client.post('/api/auth/register', json={"email": register_email, "password": password})
         response = client.post(
@@ -84,7 +137,7 @@ def register_and_login_user(client):
 def admin_auth_headers(register_and_login_user):
     """Returns authorization headers for an admin user."""
     access_token, refresh_token, _ = register_and_login_user(
-        config.ADMIN_EMAIL, "admin_pass", is_admin=True
+        config.settings.ADMIN_EMAIL, "admin_pass", is_admin=True
     )
     return {"Authorization": f"Bearer {access_token}"}, {"Authorization": f"Bearer {refresh_token}"}
 
@@ -0,0 +1,140 @@
+FIFA_BARCODE = "8930000000001"     # product id 1, stock 10
+CONSOLE_BARCODE = "8930000000002"  # product id 2, stock 5
+
+def cart_op(client, headers, barcode, action, quantity):
+    return client.post('/api/cart/op', headers=headers, json={
+        "barcode": barcode, "action": action, "quantity": quantity
+    })
+
+def test_get_cart_requires_auth(client):
+    """Test that viewing the cart requires authentication."""
+    response = client.get('/api/cart/op')
+    assert response.status_code == 401
+
+def test_cart_add_item(client, shop_client_auth_headers, db):
+    """Test adding a new item and then adding more of the same item."""
+    access_headers, _ = shop_client_auth_headers
+
+    response = cart_op(client, access_headers, FIFA_BARCODE, "add", 2)
+    assert response.status_code == 200
+    data = response.json()
+    assert data['success'] is True
+    assert data['cart_total_items'] == 2
+
+    response = cart_op(client, access_headers, FIFA_BARCODE, "add", 1)
+    assert response.json()['cart_total_items'] == 3
+
+    # Same barcode is incremented in place, not pushed twice
+    cart = db.carts.find_one({"user_identity": "client@example.com"})
+    assert len(cart['items']) == 1
+    assert cart['items'][0]['quantity'] == 3
+
+def test_cart_add_to_existing_cart_with_other_item(client, shop_client_auth_headers, db):
+    """Test adding a new barcode to a cart that already holds a different one."""
+    access_headers, _ = shop_client_auth_headers
+    db.carts.insert_one({
+        "user_identity": "client@example.com",
+        "items": [{"barcode": CONSOLE_BARCODE, "name": "Glacier White 500GB", "price": 8000000, "quantity": 1}]
+    })
+
+    response = cart_op(client, access_headers, FIFA_BARCODE, "add", 2)
+    assert response.status_code == 200
+    data = response.json()
+    assert data['success'] is True
+    assert data['cart_total_items'] == 3
+    cart = db.carts.find_one({"user_identity": "client@example.com"})
+    assert {item['barcode']: item['quantity'] for item in cart['items']} == {CONSOLE_BARCODE: 1, FIFA_BARCODE: 2}
+
+def test_cart_add_unknown_barcode(client, shop_client_auth_headers):
+    """Test adding a barcode that doesn't match any product."""
+    access_headers, _ = shop_client_auth_headers
+    response = cart_op(client, access_headers, "0000000000000", "add", 1)
+    assert response.status_code == 200
+    data = response.json()
+    assert data['success'] is False
+    assert "Unknown barcode" in data['message']
+
+def test_cart_add_insufficient_stock(client, shop_client_auth_headers, db):
+    """Test adding more items than are in stock."""
+    access_headers, _ = shop_client_auth_headers
+    cart_op(client, access_headers, FIFA_BARCODE, "add", 1)
+
+    response = cart_op(client, access_headers, CONSOLE_BARCODE, "add", 6)
+    assert response.status_code == 200
+    data = response.json()
+    assert data['success'] is False
+    assert "Insufficient stock" in data['message']
+    assert data['cart_total_items'] == 1
+    cart = db.carts.find_one({"user_identity": "client@example.com"})
+    assert all(item['barcode'] != CONSOLE_BARCODE for item in cart['items'])
+
+def test_cart_add_reads_live_stock(client, shop_client_auth_headers, db):
+    """Test that the stock check isn't served from the product cache."""
+    access_headers, _ = shop_client_auth_headers
+    assert cart_op(client, access_headers, CONSOLE_BARCODE, "add", 1).json()['success'] is True
+
+    # Stock drops (e.g. an order was processed) while the product is cached
+    db.products.update_one({"barcode": CONSOLE_BARCODE}, {"$set": {"quantity": 0}})
+    response = cart_op(client, access_headers, CONSOLE_BARCODE, "add", 1)
+    assert response.json()['success'] is False
+    assert "Insufficient stock" in response.json()['message']
+
+def test_cart_remove_item(client, shop_client_auth_headers, db):
+    """Test decreasing the quantity of an item in the cart."""
+    access_headers, _ = shop_client_auth_headers
+    cart_op(client, access_headers, FIFA_BARCODE, "add", 3)
+
+    response = cart_op(client, access_headers, FIFA_BARCODE, "remove", 1)
+    assert response.status_code == 200
+    data = response.json()
+    assert data['success'] is True
+    assert data['cart_total_items'] == 2
+    cart = db.carts.find_one({"user_identity": "client@example.com"})
+    assert cart['items'][0]['quantity'] == 2
+
+def test_cart_remove_more_than_in_cart(client, shop_client_auth_headers):
+    """Test removing more items than the cart holds."""
+    access_headers, _ = shop_client_auth_headers
+    cart_op(client, access_headers, FIFA_BARCODE, "add", 1)
+
+    response = cart_op(client, access_headers, FIFA_BARCODE, "remove", 2)
+    assert response.status_code == 200
+    data = response.json()
+    assert data['success'] is False
+    assert "Not enough items in cart" in data['message']
+    assert data['cart_total_items'] == 1
+
+def test_cart_remove_to_zero_pulls_item(client, shop_client_auth_headers, db):
+    """Test that an item whose quantity reaches zero is removed from the cart."""
+    access_headers, _ = shop_client_auth_headers
+    cart_op(client, access_headers, FIFA_BARCODE, "add", 2)
+    cart_op(client, access_headers, CONSOLE_BARCODE, "add", 1)
+
+    response = cart_op(client, access_headers, FIFA_BARCODE, "remove", 2)
+    data = response.json()
+    assert data['success'] is True
+    assert data['cart_total_items'] == 1
+    cart = db.carts.find_one({"user_identity": "client@example.com"})
+    assert [item['barcode'] for item in cart['items']] == [CONSOLE_BARCODE]
+
+def test_get_cart_after_mutation(client, shop_client_auth_headers):
+    """Test that the cached cart view reflects each cart operation."""
+    access_headers, _ = shop_client_auth_headers
+    cart_op(client, access_headers, FIFA_BARCODE, "add", 2)
+
+    response = client.get('/api/cart/op', headers=access_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]['id'] == 1
+    assert data[0]['name'] == 'Fifa 19'
+    assert data[0]['quantity'] == 2
+
+    # The cart operation must invalidate the cached response
+    cart_op(client, access_headers, FIFA_BARCODE, "remove", 1)
+    response = client.get('/api/cart/op', headers=access_headers)
+    assert response.json()[0]['quantity'] == 1
+
+    cart_op(client, access_headers, FIFA_BARCODE, "remove", 1)
+    response = client.get('/api/cart/op', headers=access_headers)
+    assert response.json() == []
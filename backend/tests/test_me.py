@@ -1,4 +1,4 @@
-from jose import jwt
+import jwt
 from backend import config
 
 def test_update_user_status_requires_auth(client):
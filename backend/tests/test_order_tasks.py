@@ -0,0 +1,59 @@
+import pytest
+from datetime import datetime
+from backend.models import OrderStatus
+from backend.orders import tasks
+
+@pytest.fixture
+def tasks_db(rs_test_db, monkeypatch):
+    """Points process_order at the replica-set test database."""
+    monkeypatch.setattr(tasks, "get_db", lambda: rs_test_db)
+    return rs_test_db
+
+def seed_order(db, order_id, items, status=OrderStatus.PAID):
+    db.order_history.insert_one({
+        "order_id": order_id, "user_identity": "client@example.com", "created_at": datetime.utcnow(),
+        "status": status.value, "items": items, "shipping_cost": 0.0, "subtotal": 0.0, "total_cost": 0.0
+    })
+
+def stock_levels(db):
+    return {p['id']: p['quantity'] for p in db.products.find({}, {"_id": 0, "id": 1, "quantity": 1})}
+
+def order_status(db, order_id):
+    return db.order_history.find_one({"order_id": order_id})['status']
+
+def test_process_order_success(tasks_db):
+    """Test that a paid order decrements stock and is marked completed."""
+    # Repeated lines for the same product are merged into one decrement
+    seed_order(tasks_db, "order_ok", [{"id": 1, "quantity": 2}, {"id": 2, "quantity": 1}, {"id": 1, "quantity": 1}])
+
+    result = tasks.process_order("order_ok")
+    assert result['status'] == "success"
+    assert order_status(tasks_db, "order_ok") == OrderStatus.COMPLETED.value
+    assert stock_levels(tasks_db) == {1: 7, 2: 4, 3: 20}
+
+def test_process_order_insufficient_stock(tasks_db):
+    """Test that a shortfall on any item fails the order without touching any stock."""
+    seed_order(tasks_db, "order_short", [{"id": 1, "quantity": 2}, {"id": 2, "quantity": 6}])
+
+    result = tasks.process_order("order_short")
+    assert result['status'] == "failure"
+    assert order_status(tasks_db, "order_short") == OrderStatus.FAILED.value
+    assert stock_levels(tasks_db) == {1: 10, 2: 5, 3: 20}
+
+def test_process_order_zero_quantity_line(tasks_db):
+    """Test that a zero-quantity line isn't mistaken for a stock shortfall."""
+    seed_order(tasks_db, "order_zero", [{"id": 1, "quantity": 1}, {"id": 3, "quantity": 0}])
+
+    result = tasks.process_order("order_zero")
+    assert result['status'] == "success"
+    assert order_status(tasks_db, "order_zero") == OrderStatus.COMPLETED.value
+    assert stock_levels(tasks_db) == {1: 9, 2: 5, 3: 20}
+
+def test_process_order_not_paid(tasks_db):
+    """Test that an order that isn't paid is left alone."""
+    seed_order(tasks_db, "order_pending", [{"id": 1, "quantity": 1}], status=OrderStatus.PENDING)
+
+    result = tasks.process_order("order_pending")
+    assert result['status'] == "failure"
+    assert order_status(tasks_db, "order_pending") == OrderStatus.PENDING.value
+    assert stock_levels(tasks_db) == {1: 10, 2: 5, 3: 20}
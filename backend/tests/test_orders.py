@@ -1,4 +1,6 @@
 from backend.models import OrderStatus
+from backend import config
+from datetime import datetime
 import time
 
 def test_checkout_requires_auth(client):
@@ -233,4 +235,29 @@ def test_receive_payment_webhook_validation_error(client):
     assert response.status_code == 422
     data = response.json()
     assert "detail" in data
-    assert any(err['loc'] == ['body', 'amount'] for err in data['detail'])
\ No newline at end of file
+    assert any(err['loc'] == ['body', 'amount'] for err in data['detail'])
+
+def test_receive_payment_webhook_failed_replay_keeps_paid_order(client, db, generate_webhook_signature_helper):
+    """Test that FAILED or mismatched webhooks can't flip an order that was already paid."""
+    order_id = "order_already_paid"
+    db.order_history.insert_one({
+        "order_id": order_id, "user_identity": "client@example.com", "created_at": datetime.utcnow(),
+        "status": OrderStatus.PAID.value, "items": [], "shipping_cost": 5.0, "subtotal": 64.0, "total_cost": 69.0
+    })
+
+    webhook_payload_data = {
+        "paymentRequestId": "txn_replay", "state": "FAILED", "amount": 69,
+        "description": "Payment for order", "referenceId": order_id, "merchantId": "MOCK_MERCHANT",
+        "extraData": "extra", "signature": ""
+    }
+    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.settings.VIETQR_WEBHOOK_SECRET_KEY)
+    response = client.post('/api/orders/webhook/payment_confirmation', json=webhook_payload_data)
+    assert response.status_code == 200
+    assert db.order_history.find_one({"order_id": order_id})['status'] == OrderStatus.PAID.value
+
+    webhook_payload_data["state"] = "SUCCESS"
+    webhook_payload_data["amount"] = 1
+    webhook_payload_data["signature"] = generate_webhook_signature_helper(webhook_payload_data, config.settings.VIETQR_WEBHOOK_SECRET_KEY)
+    response = client.post('/api/orders/webhook/payment_confirmation', json=webhook_payload_data)
+    assert response.status_code == 400
+    assert db.order_history.find_one({"order_id": order_id})['status'] == OrderStatus.PAID.value
@@ -1,5 +1,5 @@
 from backend import config
-from jose import jwt
+import jwt
 
 def test_register_user(client, db):
     """Test user registration."""
@@ -26,6 +26,15 @@ def test_register_user_duplicate_email(client):
     data = response.json()
     assert "detail" in data
 
+def test_register_admin_email_case_variant_conflicts(client, admin_auth_headers, db):
+    """Test that a case variant of the admin email can't register a second admin."""
+    response = client.post('/api/auth/register', json={
+        "email": config.settings.ADMIN_EMAIL.upper(),
+        "password": "attacker_password"
+    })
+    assert response.status_code == 409
+    assert db.users.count_documents({"role": "admin"}) == 1
+
 def test_login_user(client):
     """Test user login."""
     # Register a user first
@@ -120,4 +129,24 @@ def test_guest_login_success(client):
     decoded_token = jwt.decode(data['access_token'], config.JWT_SECRET_KEY, algorithms=["HS256"])
     assert decoded_token['sub'].startswith("guest_")
     assert decoded_token['sub'].endswith("@temp.com")
-    assert decoded_token['role'] == "guest"
\ No newline at end of file
+    assert decoded_token['role'] == "guest"
+
+def test_refresh_token_forbidden_on_admin_endpoint(client, admin_auth_headers):
+    """Test that an admin's refresh token can't be used as an access token."""
+    _, admin_refresh_headers = admin_auth_headers
+    response = client.post('/api/products', headers=admin_refresh_headers, json={
+        "name": "Refresh Product", "subtitle": "Test", "price": 1.0, "unit": "each"
+    })
+    assert response.status_code == 403
+
+def test_refresh_token_rejected_by_authenticated_endpoints(client, shop_client_auth_headers):
+    """Test that a refresh token can't authenticate a regular endpoint."""
+    _, refresh_headers = shop_client_auth_headers
+    response = client.post('/api/me/status', headers=refresh_headers, json={"theme": "dark"})
+    assert response.status_code == 401
+
+def test_refresh_requires_refresh_token(client, shop_client_auth_headers):
+    """Test that an access token can't be used to mint new access tokens."""
+    access_headers, _ = shop_client_auth_headers
+    response = client.post('/api/auth/refresh', headers=access_headers)
+    assert response.status_code == 401
@@ -1,11 +1,14 @@
 # backend/users/routes.py
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
-from pymongo import collection
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import DuplicateKeyError
+from pymongo.write_concern import WriteConcern
+import asyncio
 import uuid
 
 from .. import pwd_context, config
-from ..database import get_users_collection
+from ..database import get_users_collection_async
 from ..models import UserCreate, User, CardLogin, Role
 from .. import auth
 
@@ -14,44 +17,73 @@ router = APIRouter(
     tags=["Authentication"]
 )
 
+# Stored instead of a hash for accounts that can't log in with a password
+# (e.g. guests, who authenticate only by JWT). It never matches any hash scheme.
+UNUSABLE_PASSWORD = "!"
+
+# --- DEMO VALIDATION ---
+# In a real application, you would look up the card_id in a database
+# and verify its validity, potentially linking it to a user account.
+VALID_CARD_IDS = frozenset({"CARD123", "GUEST456", "TEMP789"})
+
+# Role claim values used when minting tokens, resolved once
+_SHOP_ROLE = Role.SHOP_CLIENT.value
+
+# Emails that register as admins, normalized to lowercase
+_ADMIN_EMAILS = frozenset({config.settings.ADMIN_EMAIL.lower()})
+
 @router.post('/register', status_code=status.HTTP_201_CREATED)
-def register_user(
+async def register_user(
     user_data: UserCreate,
-    users_collection: collection.Collection = Depends(get_users_collection),
+    users_collection: AsyncIOMotorCollection = Depends(get_users_collection_async),
 ):
     """Registers a new user."""
-    if users_collection.find_one({"email": user_data.email}):
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="User with this email already exists"
-        )
-    
+    # Normalize once so the role check, the unique index and login all see the same email
+    email = user_data.email.lower()
     # Assign role based on email
-    user_role = Role.ADMIN if user_data.email == config.ADMIN_EMAIL else Role.SHOP_CLIENT
+    user_role = Role.ADMIN if email in _ADMIN_EMAILS else Role.SHOP_CLIENT
 
-    hashed_password = pwd_context.hash(user_data.password)
+    # Hashing is deliberately CPU-heavy, so keep it off the event loop
+    hashed_password = await asyncio.to_thread(pwd_context.hash, user_data.password)
     new_user = User(
-        email=user_data.email, 
+        email=email, 
         hashed_password=hashed_password, 
         role=user_role)
     
-    users_collection.insert_one(new_user.model_dump())
+    # The unique index on `email` (see ensure_indexes) rejects duplicates atomically
+    try:
+        # User is flat with no serialization logic, so a shallow dict is all Mongo needs
+        await users_collection.insert_one(dict(new_user))
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="User with this email already exists"
+        )
     
-    return {"message": f"User {user_data.email} created successfully"}
+    return {"message": f"User {email} created successfully"}
 
 @router.post('/login')
-def login_user(
+async def login_user(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    users_collection: collection.Collection = Depends(get_users_collection),
+    users_collection: AsyncIOMotorCollection = Depends(get_users_collection_async),
 ):
     """Logs in a user and returns JWT access and refresh tokens."""
-    user_doc = users_collection.find_one({"email": form_data.username})
+    # Emails are stored lowercased at registration
+    email = form_data.username.lower()
+    user_doc = await users_collection.find_one(
+        {"email": email}, {"hashed_password": 1, "role": 1, "_id": 0}
+    )
     
-    if user_doc and pwd_context.verify(form_data.password, user_doc["hashed_password"]):
-        user_role = user_doc.get("role", Role.SHOP_CLIENT) # Default to SHOP_CLIENT if role not found
-        token_data = {"sub": form_data.username, "role": user_role.value}
-        access_token = auth.create_access_token(data=token_data)
-        refresh_token = auth.create_refresh_token(data={"sub": form_data.username})
+    verified, new_hash = (
+        await asyncio.to_thread(pwd_context.verify_and_update, form_data.password, user_doc["hashed_password"])
+        if user_doc and pwd_context.identify(user_doc["hashed_password"]) else (False, None)
+    )
+    if verified:
+        if new_hash:
+            # Upgrade legacy (e.g. bcrypt) hashes to the current default scheme
+            await users_collection.update_one({"email": email}, {"$set": {"hashed_password": new_hash}})
+        user_role = user_doc.get("role", _SHOP_ROLE) # Default to SHOP_CLIENT if role not found
+        access_token, refresh_token = auth.create_token_pair(email, user_role)
         return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
         
     raise HTTPException(
@@ -61,16 +93,12 @@ def login_user(
     )
 
 @router.post('/card_login')
-def card_login(card_login_data: CardLogin):
+async def card_login(card_login_data: CardLogin):
     """
     Logs in a user with a card ID and returns a JWT access token with limited permissions.
     """
     card_id = card_login_data.card_id
 
-    # --- DEMO VALIDATION ---
-    # In a real application, you would look up the card_id in a database
-    # and verify its validity, potentially linking it to a user account.
-    VALID_CARD_IDS = ["CARD123", "GUEST456", "TEMP789"]
     if card_id not in VALID_CARD_IDS:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -78,52 +106,52 @@ def card_login(card_login_data: CardLogin):
         )
 
     # Create a JWT with the card_id as identity and a custom 'role' claim
-    token_data = {"sub": card_id, "role": Role.SHOP_CLIENT.value}
-    access_token = auth.create_access_token(data=token_data)
-    refresh_token = auth.create_refresh_token(data={"sub": card_id})
+    access_token, refresh_token = auth.create_token_pair(card_id, _SHOP_ROLE)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 @router.post('/refresh')
-def refresh_access_token(
-    current_user: auth.TokenData = Depends(auth.get_current_user),
-    users_collection: collection.Collection = Depends(get_users_collection),
+async def refresh_access_token(
+    current_user: auth.TokenData = Depends(auth.get_refresh_token_user),
+    users_collection: AsyncIOMotorCollection = Depends(get_users_collection_async),
 ):
     """
     Endpoint to refresh an expired access token using a valid refresh token.
-    NOTE: In a real app, you'd check if the token is a refresh token (e.g., via a 'type' claim).
-    For simplicity, we're allowing any valid token to generate a new access token.
+    Only refresh tokens are accepted (see auth.get_refresh_token_user).
     """
-    # The role might not be in the refresh token, so we fetch it from the DB
-    user_doc = users_collection.find_one({"email": current_user.identity})
-    user_role = Role.SHOP_CLIENT # Default for card IDs or if not found
-    if user_doc:
-        user_role = user_doc.get("role", Role.SHOP_CLIENT)
+    # Refresh tokens carry the role claim, so normally no DB query is needed.
+    # Legacy tokens without it fall back to the DB; card IDs aren't stored as users,
+    # so only email identities need the lookup.
+    user_role = current_user.role or _SHOP_ROLE # Default for card IDs or if not found
+    if current_user.role is None and "@" in current_user.identity:
+        user_doc = await users_collection.find_one({"email": current_user.identity}, {"role": 1, "_id": 0})
+        if user_doc:
+            user_role = user_doc.get("role", _SHOP_ROLE)
 
-    token_data = {"sub": current_user.identity, "role": user_role.value}
+    token_data = {"sub": current_user.identity, "role": user_role}
     new_access_token = auth.create_access_token(data=token_data)
     return {"access_token": new_access_token, "token_type": "bearer"}
 
 @router.post('/guest_login')
-def guest_login(
-    users_collection: collection.Collection = Depends(get_users_collection),
+async def guest_login(
+    users_collection: AsyncIOMotorCollection = Depends(get_users_collection_async),
 ):
     """
     Creates a temporary guest user and logs them in, returning JWT tokens.
     Each call creates a new guest user.
     """
-    guest_id = str(uuid.uuid4())
+    guest_id = uuid.uuid4().hex
     guest_email = f"guest_{guest_id}@temp.com"
-    # Guests don't need a memorable password, but we hash one for consistency with User model
-    hashed_password = pwd_context.hash(str(uuid.uuid4())) 
+    # Guests never log in with a password, so skip hashing and store an unusable marker
+    hashed_password = UNUSABLE_PASSWORD
 
     new_guest_user = User(
         email=guest_email,
         hashed_password=hashed_password,
         role=Role.SHOP_CLIENT
     )
-    users_collection.insert_one(new_guest_user.model_dump())
+    # Guests are ephemeral, so a primary-only ack is enough; registration keeps the default
+    guest_users_collection = users_collection.with_options(write_concern=WriteConcern(w=1))
+    await guest_users_collection.insert_one(dict(new_guest_user))
 
-    token_data = {"sub": guest_email, "role": Role.SHOP_CLIENT.value}
-    access_token = auth.create_access_token(data=token_data)
-    refresh_token = auth.create_refresh_token(data={"sub": guest_email})
+    access_token, refresh_token = auth.create_token_pair(guest_email, _SHOP_ROLE)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
\ No newline at end of file